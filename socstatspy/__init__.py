@@ -15,6 +15,9 @@ Example:
     >>> data = client.get_data('dodsorsaker', matt=1, ar='2020,2021')
 """
 
+# Defined before the submodule imports, which read it (e.g. for the User-Agent)
+__version__ = '0.1.0'
+
 from .client import SocstatsClient
 from .data_fetcher import DataFetcher
 from .exceptions import (
@@ -24,7 +27,6 @@ from .exceptions import (
     SocstatsNotFoundError
 )
 
-__version__ = '0.1.0'
 __author__ = 'socstatspy'
 __all__ = [
     'SocstatsClient',
@@ -3,12 +3,21 @@ Main client for interacting with Socialstyrelsen's API
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+import random
+import threading
 import time
-from typing import Dict, List, Optional, Union, Any
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union, Any
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import logging
 import pandas as pd
 
+from . import __version__
 from .exceptions import (
     SocstatsAPIError,
     SocstatsValidationError,
@@ -16,12 +25,40 @@ from .exceptions import (
     SocstatsNotFoundError
 )
 from .data_fetcher import DataFetcher
+from .utils import record_fields
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Optional on-disk HTTP caching
+try:
+    from cachecontrol.adapter import CacheControlAdapter
+    from cachecontrol.caches.file_cache import FileCache
+except ImportError:
+    CacheControlAdapter = None
+
+# Prefer orjson for decoding responses when it is installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+# Library logger; applications decide whether and how messages are shown
 logger = logging.getLogger(__name__)
 
 
+class _JitteredRetry(Retry):
+    """
+    urllib3 Retry with capped exponential backoff and random jitter.
+    
+    The jitter spreads out retries of requests that failed together, such
+    as concurrently fetched pages, so they do not hit the API in lockstep.
+    """
+    
+    def get_backoff_time(self) -> float:
+        backoff = min(SocstatsClient.RETRY_BACKOFF_MAX, super().get_backoff_time())
+        return backoff * random.uniform(0.5, 1.5)
+
+
 class SocstatsClient:
     """
     Main client for interacting with Socialstyrelsen's Statistics Database API.
@@ -49,14 +86,31 @@ class SocstatsClient:
     DEFAULT_VERSION = "v1"
     DEFAULT_LANGUAGE = "sv"
     MAX_RETRIES = 3
-    RETRY_DELAY = 2  # seconds
+    RETRY_BACKOFF_FACTOR = 0.3  # seconds, grows exponentially per retry
+    RETRY_BACKOFF_MAX = 30  # seconds
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    MAX_CONCURRENCY = 8  # parallel page requests during pagination
+    POOL_CONNECTIONS = 4  # number of host pools to keep
+    POOL_MAXSIZE = 32  # keep-alive connections per host pool
+    METADATA_TTL = 60 * 60  # seconds metadata responses are reused in memory
+    METADATA_CACHE_SIZE = 512  # metadata responses kept in memory
+    DEFAULT_HEADERS = {
+        'User-Agent': f'socstatspy/{__version__}',
+        'Accept': 'application/json',
+        # Compressed responses; includes br/zstd only when urllib3 can decode them
+        'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding'],
+        'Connection': 'keep-alive'
+    }
     
     def __init__(
         self,
         version: str = None,
         language: str = None,
         timeout: int = 30,
-        max_retries: int = None
+        max_retries: int = None,
+        max_concurrency: int = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+        cache_ttl: int = DataFetcher.DEFAULT_CACHE_TTL
     ):
         """
         Initialize the Socialstyrelsen API client.
@@ -66,22 +120,81 @@ class SocstatsClient:
             language: Language for responses - 'sv' or 'en' (default: 'sv')
             timeout: Request timeout in seconds (default: 30)
             max_retries: Maximum number of retry attempts (default: 3)
+            max_concurrency: Maximum number of pages or metadata variables
+                            fetched in parallel (default: 8)
+            cache_dir: Directory for persisting subject metadata between sessions,
+                      e.g. '~/.cache/socstatspy' (default: None, memory only).
+                      With the optional cachecontrol package installed, HTTP
+                      responses are cached there too.
+            cache_ttl: Seconds before persisted metadata is fetched again (default: 86400)
         """
         self.base_url = self.BASE_URL
         self.version = version or self.DEFAULT_VERSION
         self.language = language or self.DEFAULT_LANGUAGE
         self.timeout = timeout
         self.max_retries = max_retries or self.MAX_RETRIES
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        
+        # URL prefix shared by every endpoint, built once
+        self._prefix = self.base_url.rstrip('/') + '/'
         
+        # Metadata responses by URL, as (expiry time, decoded response)
+        self._response_cache = {}
+        self._response_cache_lock = threading.Lock()
+        
+        # Headers set once on the session are sent with every request
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'socstatspy/0.1.0',
-            'Accept': 'application/json'
-        })
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        
+        adapter = self._create_adapter(cache_dir)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # Initialize data fetcher
-        self.data_fetcher = DataFetcher(self)
+        self.data_fetcher = DataFetcher(self, cache_dir=cache_dir, cache_ttl=cache_ttl)
+        
+    def _create_adapter(self, cache_dir: Optional[Union[str, Path]] = None) -> HTTPAdapter:
+        """
+        Create the pooled HTTP adapter mounted on the session.
+        
+        If a cache directory is given and the optional cachecontrol package is
+        installed, responses are also cached on disk under '<cache_dir>/http'
+        following the API's Cache-Control and ETag headers.
+        
+        Args:
+            cache_dir: Optional cache directory
+            
+        Returns:
+            HTTPAdapter with connection pooling and retries
+        """
+        # Retry failed connections and failing responses on the pooled connection.
+        # raise_on_status=False hands the final response back to _make_request
+        # so it can be mapped to the matching Socstats exception.
+        retry = _JitteredRetry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            backoff_factor=self.RETRY_BACKOFF_FACTOR,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter_kwargs = {
+            'pool_connections': self.POOL_CONNECTIONS,
+            # Keep a connection per concurrent request so none are discarded
+            'pool_maxsize': max(self.POOL_MAXSIZE, self.max_concurrency),
+            'max_retries': retry
+        }
+        
+        if cache_dir is not None and CacheControlAdapter is not None:
+            try:
+                http_cache = FileCache(str(Path(cache_dir).expanduser() / 'http'))
+                return CacheControlAdapter(cache=http_cache, **adapter_kwargs)
+            except ImportError as e:
+                logger.warning(f"HTTP response caching disabled: {e}")
         
+        return HTTPAdapter(**adapter_kwargs)
+    
     def _build_url(self, *parts: str) -> str:
         """
         Build a complete URL from path components.
@@ -92,18 +205,70 @@ class SocstatsClient:
         Returns:
             Complete URL string
         """
-        # Filter out empty parts and join with '/'
-        filtered_parts = [str(p) for p in parts if p]
-        if not filtered_parts:
+        # Filter out empty parts and join with '/'; parts are plain path
+        # segments, so no URL parsing or quoting is needed
+        path = '/'.join(map(str, filter(None, parts)))
+        if not path:
             return self.base_url
         
-        # Join all parts with '/'
-        path = '/'.join(filtered_parts)
+        return self._prefix + path
+    
+    def _get_metadata(self, endpoint: str) -> Any:
+        """
+        Get a metadata endpoint, reusing responses fetched within METADATA_TTL.
         
-        # Ensure base_url ends with '/' for proper joining
-        base = self.base_url if self.base_url.endswith('/') else self.base_url + '/'
+        Versions, languages, subjects and variable values rarely change, so
+        repeated lookups within a session are served from memory.
         
-        return base + path
+        Args:
+            endpoint: Complete endpoint URL
+            
+        Returns:
+            Decoded JSON response (lists are returned as copies, with the
+            dictionaries in them copied too)
+        """
+        now = time.monotonic()
+        with self._response_cache_lock:
+            entry = self._response_cache.get(endpoint)
+        
+        if entry is not None and entry[0] > now:
+            data = entry[1]
+        else:
+            data = self._make_request(endpoint)
+            with self._response_cache_lock:
+                if len(self._response_cache) >= self.METADATA_CACHE_SIZE:
+                    # Evict the oldest entry
+                    self._response_cache.pop(next(iter(self._response_cache)))
+                self._response_cache[endpoint] = (now + self.METADATA_TTL, data)
+        
+        # Callers may modify the returned list and its records without
+        # touching the cached ones
+        if isinstance(data, list):
+            return [dict(item) if isinstance(item, dict) else item for item in data]
+        return data
+    
+    def clear_metadata_cache(self):
+        """Forget metadata responses kept in memory, so they are fetched again."""
+        with self._response_cache_lock:
+            self._response_cache.clear()
+    
+    @staticmethod
+    def _to_dataframe(records: List[Dict]) -> pd.DataFrame:
+        """
+        Convert a list of API records to a DataFrame.
+        
+        The columns are the fields of all records, so optional fields missing
+        from some records are kept.
+        
+        Args:
+            records: List of record dictionaries
+            
+        Returns:
+            pandas DataFrame with one row per record
+        """
+        if not records:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records(records, columns=record_fields(records))
     
     def _make_request(
         self,
@@ -115,6 +280,10 @@ class SocstatsClient:
         """
         Make an HTTP request to the API with retry logic.
         
+        Connection errors, timeouts, rate limited (429) and server error (5xx)
+        responses are retried by the session's HTTPAdapter, on the pooled
+        connection and with jittered exponential backoff.
+        
         Args:
             endpoint: API endpoint path
             method: HTTP method (default: 'GET')
@@ -132,48 +301,79 @@ class SocstatsClient:
         # The endpoint is already a complete URL built by the caller
         url = endpoint
         
-        for attempt in range(self.max_retries):
-            try:
-                response = self.session.request(
-                    method=method,
-                    url=url,
-                    params=params,
-                    timeout=self.timeout,
-                    **kwargs
-                )
-                
-                # Handle different status codes
-                if response.status_code == 404:
-                    raise SocstatsNotFoundError(
-                        f"Resource not found: {url}"
-                    )
-                elif response.status_code == 429:
-                    raise SocstatsRateLimitError(
-                        "API rate limit exceeded. Please wait before making more requests."
-                    )
-                elif response.status_code >= 400:
-                    raise SocstatsAPIError(
-                        f"API request failed with status {response.status_code}: {response.text}"
-                    )
-                
-                response.raise_for_status()
-                
-                # Return JSON response
-                return response.json()
-                
-            except requests.exceptions.Timeout:
-                if attempt < self.max_retries - 1:
-                    logger.warning(f"Request timeout, retrying... (attempt {attempt + 1})")
-                    time.sleep(self.RETRY_DELAY)
-                else:
-                    raise SocstatsAPIError(f"Request timeout after {self.max_retries} attempts")
-                    
-            except requests.exceptions.RequestException as e:
-                if attempt < self.max_retries - 1:
-                    logger.warning(f"Request failed, retrying... (attempt {attempt + 1}): {e}")
-                    time.sleep(self.RETRY_DELAY)
-                else:
-                    raise SocstatsAPIError(f"Request failed after {self.max_retries} attempts: {e}")
+        try:
+            response = self.session.request(
+                method=method,
+                url=url,
+                params=params,
+                timeout=self.timeout,
+                **kwargs
+            )
+        except requests.exceptions.Timeout as e:
+            raise SocstatsAPIError(f"Request timeout after {self.max_retries} retries: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise SocstatsAPIError(f"Request failed after {self.max_retries} retries: {e}") from e
+        
+        # Handle different status codes
+        if response.status_code == 404:
+            raise SocstatsNotFoundError(
+                f"Resource not found: {url}"
+            )
+        elif response.status_code == 429:
+            raise SocstatsRateLimitError(
+                "API rate limit exceeded. Please wait before making more requests."
+            )
+        elif response.status_code >= 400:
+            raise SocstatsAPIError(
+                f"API request failed with status {response.status_code}: {response.text}"
+            )
+        
+        response.raise_for_status()
+        
+        # Return decoded JSON response
+        try:
+            return _json_loads(response.content)
+        except ValueError as e:
+            raise SocstatsAPIError(f"Invalid JSON response from {url}: {e}")
+    
+    def _request_page(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Request one page of data and check that it has the expected shape.
+        
+        Args:
+            endpoint: Complete URL of the page
+            params: Query parameters
+            
+        Returns:
+            Decoded page with a 'data' list
+            
+        Raises:
+            SocstatsAPIError: If the response is not an object with a 'data' list
+        """
+        page = self._make_request(endpoint, params=params)
+        
+        if not isinstance(page, dict) or not isinstance(page.get('data', []), list):
+            raise SocstatsAPIError(
+                f"Unexpected response from {endpoint}: expected an object with a 'data' list"
+            )
+        return page
+    
+    @staticmethod
+    def _page_url(next_url: str, page: int) -> str:
+        """
+        Build the URL for a specific page from a 'nasta_sida' URL.
+        
+        Args:
+            next_url: Next page URL as returned by the API
+            page: Page number to request
+            
+        Returns:
+            URL with the 'sida' query parameter set to the given page
+        """
+        scheme, netloc, path, query, fragment = urlsplit(next_url)
+        params = [(k, v) for k, v in parse_qsl(query) if k != 'sida']
+        params.append(('sida', str(page)))
+        return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
     
     # ===== Meta API Methods =====
     
@@ -190,7 +390,7 @@ class SocstatsClient:
             [{'kod': 'v1', 'text': 'Version 1'}]
         """
         endpoint = self._build_url()
-        return self._make_request(endpoint)
+        return self._get_metadata(endpoint)
     
     def list_languages(self) -> List[Dict[str, str]]:
         """
@@ -205,7 +405,7 @@ class SocstatsClient:
             [{'kod': 'sv', 'text': 'Svenska'}, {'kod': 'en', 'text': 'English'}]
         """
         endpoint = self._build_url(self.version)
-        return self._make_request(endpoint)
+        return self._get_metadata(endpoint)
     
     def list_subjects(self, as_dataframe: bool = False) -> Union[List[Dict[str, str]], pd.DataFrame]:
         """
@@ -228,10 +428,10 @@ class SocstatsClient:
             >>> print(df)
         """
         endpoint = self._build_url(self.version, self.language)
-        subjects = self._make_request(endpoint)
+        subjects = self._get_metadata(endpoint)
         
         if as_dataframe:
-            return pd.DataFrame(subjects)
+            return self._to_dataframe(subjects)
         return subjects
     
     def get_subject_variables(
@@ -259,10 +459,10 @@ class SocstatsClient:
             >>> print(df)
         """
         endpoint = self._build_url(self.version, self.language, subject)
-        variables = self._make_request(endpoint)
+        variables = self._get_metadata(endpoint)
         
         if as_dataframe:
-            return pd.DataFrame(variables)
+            return self._to_dataframe(variables)
         return variables
     
     # ===== Variable Metadata Methods =====
@@ -271,7 +471,7 @@ class SocstatsClient:
         self,
         subject: str,
         variable: str,
-        ids: Optional[Union[str, List[str]]] = None,
+        ids: Optional[Union[int, str, List[Union[int, str]]]] = None,
         text_filter: Optional[str] = None,
         as_dataframe: bool = False
     ) -> Union[List[Dict], pd.DataFrame]:
@@ -281,7 +481,7 @@ class SocstatsClient:
         Args:
             subject: Subject name
             variable: Variable name (e.g., 'diagnos', 'region', 'alder', 'kon', 'matt', 'ar')
-            ids: Optional ID or list of IDs to filter by
+            ids: Optional ID or list of IDs to filter by, fetched in a single request
             text_filter: Optional text to filter values by
             as_dataframe: If True, return as pandas DataFrame (default: False)
             
@@ -302,25 +502,39 @@ class SocstatsClient:
             >>> df = client.get_variable_values('dodsorsaker', 'region', as_dataframe=True)
             >>> print(df)
         """
+        from .utils import format_id_list
+        
+        # Convert IDs to a comma-separated string, so several IDs take one request
+        if ids is not None:
+            ids = format_id_list(ids)
+        
         if ids and text_filter:
             raise SocstatsValidationError("Cannot specify both 'ids' and 'text_filter'")
         
+        # Filter locally if all values of the variable are already cached
+        if text_filter:
+            cached = self.data_fetcher._cached_variable_values(subject, variable)
+            if cached is not None and 'text' in cached:
+                needle = text_filter.lower()
+                matches = [
+                    value for value in self.data_fetcher._to_records(cached)
+                    if isinstance(value['text'], str) and needle in value['text'].lower()
+                ]
+                return pd.DataFrame(matches, columns=list(cached)) if as_dataframe else matches
+        
         # Build endpoint
         parts = [self.version, self.language, subject, variable]
         
         if ids:
-            # Convert IDs to comma-separated string
-            if isinstance(ids, list):
-                ids = ','.join(str(i) for i in ids)
             parts.append(ids)
         elif text_filter:
             parts.extend(['text', text_filter])
         
         endpoint = self._build_url(*parts)
-        values = self._make_request(endpoint)
+        values = self._get_metadata(endpoint)
         
         if as_dataframe:
-            return pd.DataFrame(values)
+            return self._to_dataframe(values)
         return values
     
     # ===== Data Fetching Methods =====
@@ -361,19 +575,7 @@ class SocstatsClient:
             >>> # Get single page
             >>> data = client.get_data('dodsorsaker', matt=1, sida=2, auto_paginate=False)
         """
-        # Build endpoint
-        parts = [self.version, self.language, subject, 'resultat']
-        
-        from .utils import format_id_list
-        
-        # Add matt filter (normalize to string)
-        if matt is not None:
-            parts.extend(['matt', format_id_list(matt)])
-        
-        # Add other filters (normalize all to strings)
-        for key, value in filters.items():
-            if value is not None:
-                parts.extend([key, format_id_list(value)])
+        endpoint = self._data_endpoint(subject, matt, filters)
         
         # Build query parameters
         params = {}
@@ -383,33 +585,68 @@ class SocstatsClient:
             params['sida'] = sida
         
         # Make initial request
-        endpoint = self._build_url(*parts)
-        result = self._make_request(endpoint, params=params)
+        result = self._request_page(endpoint, params=params)
         
         # Handle pagination if requested
         if auto_paginate and result.get('nasta_sida') and sida is None:
-            all_data = result.get('data', [])
-            page_count = 1
+            # Collect each page's records and flatten them once at the end
+            pages = [result.get('data', [])]
+            total_pages = result.get('sidor')
             
-            while result.get('nasta_sida'):
-                if max_pages and page_count >= max_pages:
+            if total_pages:
+                # Total page count is known, so fetch the remaining pages concurrently
+                last_page = min(total_pages, max_pages) if max_pages else total_pages
+                if max_pages and total_pages > max_pages:
                     logger.info(f"Reached maximum page limit of {max_pages}")
-                    break
-                
-                # Extract page number from next page URL
-                next_url = result['nasta_sida']
-                page_count += 1
                 
-                logger.info(f"Fetching page {page_count}...")
+                page_urls = [
+                    self._page_url(result['nasta_sida'], page)
+                    for page in range(2, last_page + 1)
+                ]
+                if page_urls:
+                    logger.info(f"Fetching pages 2-{last_page} concurrently...")
+                    workers = min(self.max_concurrency, len(page_urls))
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        # map() yields results in page order regardless of completion order
+                        pages.extend(
+                            page_result.get('data', [])
+                            for page_result in executor.map(self._request_page, page_urls)
+                        )
                 
-                # Make request to next page (next_url is already a complete URL)
-                result = self._make_request(next_url)
-                all_data.extend(result.get('data', []))
+                # Point to the first page not fetched, as the last page would
+                if last_page < total_pages:
+                    result['nasta_sida'] = self._page_url(result['nasta_sida'], last_page + 1)
+                else:
+                    result['nasta_sida'] = None
+                page_count = last_page
+            else:
+                page_count = 1
                 
-                # Small delay to be respectful to the API
-                time.sleep(0.1)
+                while result.get('nasta_sida'):
+                    # A page shorter than the server's page size is the last one,
+                    # so don't spend a request on following its 'nasta_sida'
+                    page_size = result.get('per_sida')
+                    if page_size and len(result.get('data', [])) < page_size:
+                        result['nasta_sida'] = None
+                        break
+                    
+                    if max_pages and page_count >= max_pages:
+                        logger.info(f"Reached maximum page limit of {max_pages}")
+                        break
+                    
+                    # Extract page number from next page URL
+                    next_url = result['nasta_sida']
+                    page_count += 1
+                    
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(f"Fetching page {page_count}...")
+                    
+                    # Make request to next page (next_url is already a complete URL)
+                    result = self._request_page(next_url)
+                    pages.append(result.get('data', []))
             
             # Update result with all data
+            all_data = list(chain.from_iterable(pages))
             result['data'] = all_data
             result['sida'] = 1
             result['per_sida'] = len(all_data)
@@ -419,6 +656,95 @@ class SocstatsClient:
         
         return result
     
+    def get_data_iter(
+        self,
+        subject: str,
+        matt: Optional[Union[int, str, List[Union[int, str]]]] = None,
+        per_sida: int = 5000,
+        max_pages: Optional[int] = None,
+        **filters
+    ) -> Iterator[Dict]:
+        """
+        Iterate over the records of a subject, fetching one page at a time.
+        
+        Unlike get_data, pages are requested sequentially as the iterator is
+        consumed and only the current page is held in memory, which suits
+        processing very large results row by row.
+        
+        Args:
+            subject: Subject name
+            matt: Measure ID
+            per_sida: Number of records per page (default: 5000, max: 5000)
+            max_pages: Maximum number of pages to fetch (default: None, unlimited)
+            **filters: Additional filters, as for get_data
+            
+        Yields:
+            One dictionary per record
+            
+        Example:
+            >>> for row in client.get_data_iter('dodsorsaker', matt=1, ar=2020):
+            ...     print(row['varde'])
+        """
+        endpoint = self._data_endpoint(subject, matt, filters)
+        params = {'per_sida': per_sida} if per_sida != 5000 else {}
+        
+        result = self._request_page(endpoint, params=params)
+        page_count = 1
+        
+        while True:
+            rows = result.get('data', [])
+            yield from rows
+            
+            next_url = result.get('nasta_sida')
+            if not next_url:
+                break
+            
+            # A page shorter than the server's page size is the last one
+            page_size = result.get('per_sida')
+            if page_size and len(rows) < page_size:
+                break
+            
+            if max_pages and page_count >= max_pages:
+                logger.info(f"Reached maximum page limit of {max_pages}")
+                break
+            
+            page_count += 1
+            result = self._request_page(next_url)
+    
+    def _data_endpoint(
+        self,
+        subject: str,
+        matt: Optional[Union[int, str, List[Union[int, str]]]],
+        filters: Dict
+    ) -> str:
+        """
+        Build the URL of a subject's result endpoint.
+        
+        Args:
+            subject: Subject name
+            matt: Measure ID, or None for the subject's default
+            filters: Filter values by variable name
+            
+        Returns:
+            Complete endpoint URL
+        """
+        from .utils import format_id_list
+        
+        # Build endpoint path below version/language
+        parts = [subject, 'resultat']
+        
+        # Add matt filter (normalize to string)
+        if matt is not None:
+            parts.extend(['matt', format_id_list(matt)])
+        
+        # Add other filters (normalize all to strings)
+        for key, value in filters.items():
+            if value is not None:
+                parts.extend([key, format_id_list(value)])
+        
+        # All parts are already strings, so join them directly
+        return f"{self._prefix}{self.version}/{self.language}/" + '/'.join(parts)
+    
     def get_data_as_dataframe(
         self,
         subject: str,
@@ -2,10 +2,20 @@
 Data fetcher and processor for converting API responses to pandas DataFrames
 """
 
+import os
+import pickle
+import tempfile
+import threading
+import time
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Union, Any
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union, Any
 import logging
 
+from .utils import record_fields
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,15 +27,35 @@ class DataFetcher:
     and enrich them with metadata labels.
     """
     
-    def __init__(self, client):
+    MAX_WORKERS = 8  # parallel variable value requests, unless the client sets max_concurrency
+    BATCH_ID_THRESHOLD = 50  # fetch only the needed IDs when there are at most this many
+    DENSE_ID_SPAN = 10_000  # integer IDs spanning fewer values are labelled via a lookup table
+    DEFAULT_CACHE_TTL = 24 * 60 * 60  # seconds
+    
+    def __init__(
+        self,
+        client,
+        cache_dir: Optional[Union[str, Path]] = None,
+        cache_ttl: int = DEFAULT_CACHE_TTL
+    ):
         """
         Initialize the DataFetcher.
         
         Args:
             client: SocstatsClient instance
+            cache_dir: Directory for persisting subject metadata between sessions,
+                      e.g. '~/.cache/socstatspy' (default: None, memory only)
+            cache_ttl: Seconds before persisted metadata is fetched again (default: 86400)
         """
         self.client = client
         self._metadata_cache = {}
+        # Variables per subject fetched for a subset of IDs, with the IDs requested
+        self._partial_variables = {}
+        # Subjects whose metadata is being fetched, so concurrent calls can wait for it
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir is not None else None
+        self.cache_ttl = cache_ttl
     
     def get_data_as_dataframe(
         self,
@@ -64,89 +94,448 @@ class DataFetcher:
             logger.warning("No data returned from API")
             return pd.DataFrame()
         
-        df = pd.DataFrame(data)
+        # Pass the columns instead of letting pandas infer them from every dict
+        df = pd.DataFrame.from_records(data, columns=record_fields(data))
+        self._downcast_id_columns(df)
         
         # Add metadata as attributes
         df.attrs['subject'] = result.get('amne', subject)
         df.attrs['total_pages'] = result.get('sidor', 1)
         df.attrs['records_per_page'] = result.get('per_sida', len(data))
+        
+        # The columnar DataFrame holds the data now, so release the per-row
+        # dicts before enrichment instead of keeping both alive until return
+        del data
+        result.pop('data', None)
 
-        # Enrich with metadata labels if requested
+        # Enrich with metadata labels if requested, fetching labels only
+        # for the IDs present in the data where there are few of them
         if include_metadata:
-            metadata = self._get_subject_metadata(subject)
+            wanted_ids = {
+                meta_key: self._unique_ids(df[col_name])
+                for col_name, meta_key in self._label_columns(df).items()
+            }
+            metadata = self._get_subject_metadata(subject, ids=wanted_ids)
             df = self._enrich_dataframe(df, metadata)
         
         return df
     
-    def _get_subject_metadata(self, subject: str) -> Dict[str, pd.DataFrame]:
+    @staticmethod
+    def _unique_ids(col: pd.Series) -> List:
+        """
+        Get the distinct IDs of a column, as they appear in API URLs.
+        
+        Missing values turn integer ID columns into floats, so whole floats
+        are converted back to integers to request e.g. '1,2' and not '1.0,2.0'.
+        
+        Args:
+            col: ID column
+            
+        Returns:
+            List of distinct non-null IDs
+        """
+        ids = col.dropna().unique()
+        
+        if ids.dtype.kind == 'f' and np.all(np.mod(ids, 1) == 0):
+            ids = ids.astype(np.int64)
+        
+        return ids.tolist()
+    
+    @staticmethod
+    def _downcast_id_columns(df: pd.DataFrame) -> None:
+        """
+        Store integer ID columns as int32 when their values fit.
+        
+        Args:
+            df: DataFrame to convert (modified in place)
+        """
+        int32 = np.iinfo(np.int32)
+        
+        for col_name in df.columns:
+            if not (col_name == 'ar' or col_name.endswith('Id')):
+                continue
+            
+            col = df[col_name]
+            if col.dtype.kind not in 'iu' or col.empty:
+                continue
+            
+            if int32.min <= col.min() and col.max() <= int32.max:
+                df[col_name] = col.astype(np.int32)
+    
+    def _get_subject_metadata(
+        self,
+        subject: str,
+        ids: Optional[Dict[str, List]] = None
+    ) -> Dict[str, Dict[str, List]]:
         """
         Get and cache metadata for all variables in a subject.
         
+        Concurrent calls for the same subject are coalesced: while one thread
+        fetches the metadata, the others wait for it and are then served from
+        the cache it filled, instead of issuing the same requests again.
+        Calls take turns, so topping up partially fetched variables in the
+        shared cache never runs in two threads at once.
+        
         Args:
             subject: Subject name
+            ids: Optional mapping of variable names to the IDs that need labels.
+                 See _load_subject_metadata.
             
         Returns:
-            Dictionary mapping variable names to DataFrames with their values
+            Dictionary mapping variable names to their values as columns
+        """
+        while True:
+            with self._inflight_lock:
+                fetching = self._inflight.get(subject)
+                if fetching is None:
+                    fetching = self._inflight[subject] = threading.Event()
+                    break
+            fetching.wait()
+        
+        try:
+            return self._load_subject_metadata(subject, ids)
+        finally:
+            with self._inflight_lock:
+                del self._inflight[subject]
+            fetching.set()
+    
+    def _load_subject_metadata(
+        self,
+        subject: str,
+        ids: Optional[Dict[str, List]] = None
+    ) -> Dict[str, Dict[str, List]]:
+        """
+        Get metadata for a subject from the caches or the API.
+        
+        If ``ids`` lists the IDs that need labels for a variable and there are
+        at most BATCH_ID_THRESHOLD of them, only those values are requested in
+        a single call instead of every value of the variable. Such partially
+        fetched variables are topped up by later calls when other IDs are needed.
+        With a cache directory every variable is fetched in full, so that the
+        metadata can be persisted.
+        
+        Args:
+            subject: Subject name
+            ids: Optional mapping of variable names to the IDs that need labels.
+                 Variables not listed are fetched in full.
+            
+        Returns:
+            Dictionary mapping variable names to their values as columns,
+            e.g. {'kon': {'id': [1, 2], 'text': ['Man', 'Kvinna']}}
         """
         cache_key = subject
         
-        if cache_key in self._metadata_cache:
-            return self._metadata_cache[cache_key]
+        metadata = self._metadata_cache.get(cache_key)
+        if metadata is None:
+            metadata = self._load_cached_metadata(subject)
+            if metadata is not None:
+                self._metadata_cache[cache_key] = metadata
+        
+        if metadata is not None:
+            self._complete_partial_metadata(subject, metadata, ids)
+            return metadata
         
         logger.info(f"Fetching metadata for subject: {subject}")
         
         metadata = {}
+        partial = {}
+        complete = True
         
         # Get all distribution variables for the subject
         try:
             variables = self.client.get_subject_variables(subject)
+            var_names = [v.get('namn') for v in variables if v.get('namn')]
+            
+            # Request only the needed IDs for variables with few of them, unless
+            # the metadata is persisted: a full fetch then serves later sessions
+            batch_ids = ids if self.cache_dir is None else None
+            requested = {}
+            for var_name in var_names:
+                wanted = (batch_ids or {}).get(var_name)
+                if wanted and len(wanted) <= self.BATCH_ID_THRESHOLD:
+                    requested[var_name] = wanted
+                else:
+                    requested[var_name] = None
+            
+            values_by_var, complete = self._fetch_variable_values(subject, requested)
+            
+            # Record the IDs of batched variables once they are fetched; a failed
+            # batch is recorded with none, so later calls request its IDs again
+            for var_name, wanted in requested.items():
+                if wanted is not None:
+                    partial[var_name] = set(wanted) if var_name in values_by_var else set()
             
-            for var_info in variables:
-                var_name = var_info.get('namn')
-                if not var_name:
+            for var_name, values in values_by_var.items():
+                if values:
+                    # Store as plain columns; labelling only needs the id and text arrays
+                    metadata[var_name] = self._to_columns(values)
+                    logger.debug(f"Cached metadata for {var_name}: {len(values)} entries")
+        
+        except Exception as e:
+            logger.warning(f"Could not fetch subject variables: {e}")
+            complete = False
+        
+        # Cache the metadata, only persisting it to disk if it is complete
+        self._metadata_cache[cache_key] = metadata
+        self._partial_variables[cache_key] = partial
+        if complete and not partial:
+            self._save_cached_metadata(subject, metadata)
+        
+        return metadata
+    
+    def _complete_partial_metadata(
+        self,
+        subject: str,
+        metadata: Dict[str, Dict[str, List]],
+        ids: Optional[Dict[str, List]]
+    ) -> None:
+        """
+        Fetch values missing from partially fetched variables of cached metadata.
+        
+        Args:
+            subject: Subject name
+            metadata: Cached metadata for the subject (updated in place)
+            ids: Mapping of variable names to the IDs that need labels, or None
+                 to fetch every partially fetched variable in full
+        """
+        partial = self._partial_variables.get(subject)
+        if not partial:
+            return
+        
+        requested = {}
+        for var_name, fetched_ids in partial.items():
+            if ids is None:
+                requested[var_name] = None
+            elif var_name in ids:
+                missing = [i for i in ids[var_name] if i not in fetched_ids]
+                if not missing:
                     continue
-                
+                if len(fetched_ids) + len(missing) <= self.BATCH_ID_THRESHOLD:
+                    requested[var_name] = missing
+                else:
+                    requested[var_name] = None
+        
+        if not requested:
+            return
+        
+        values_by_var, _ = self._fetch_variable_values(subject, requested)
+        
+        for var_name, values in values_by_var.items():
+            if requested[var_name] is None:
+                # Fetched in full, so the variable is no longer partial
+                if values:
+                    metadata[var_name] = self._to_columns(values)
+                del partial[var_name]
+                continue
+            
+            partial[var_name].update(requested[var_name])
+            if values:
+                metadata[var_name] = self._to_columns(
+                    self._to_records(metadata.get(var_name, {})) + values
+                )
+    
+    @staticmethod
+    def _to_columns(values: List[Dict]) -> Dict[str, List]:
+        """
+        Convert variable values from records to columns.
+        
+        Args:
+            values: List of value dictionaries, e.g. [{'id': 1, 'text': 'Man'}]
+            
+        Returns:
+            Dictionary mapping field names to lists, e.g. {'id': [1], 'text': ['Man']}
+        """
+        return {field: [value.get(field) for value in values] for field in record_fields(values)}
+    
+    @staticmethod
+    def _to_records(columns: Dict[str, List]) -> List[Dict]:
+        """
+        Convert variable values from columns back to records.
+        
+        Args:
+            columns: Dictionary mapping field names to lists
+            
+        Returns:
+            List of value dictionaries
+        """
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+    
+    def _fetch_variable_values(
+        self,
+        subject: str,
+        requested: Dict[str, Optional[List]]
+    ) -> Tuple[Dict[str, List[Dict]], bool]:
+        """
+        Fetch values for several variables concurrently.
+        
+        Args:
+            subject: Subject name
+            requested: Mapping of variable names to the IDs to fetch, or None
+                       to fetch all values of the variable
+            
+        Returns:
+            Tuple of a dictionary mapping variable names to their values and a
+            flag that is False if any variable could not be fetched
+        """
+        values_by_var = {}
+        complete = True
+        
+        if not requested:
+            return values_by_var, complete
+        
+        # Fetch values for all variables concurrently over the client's pooled
+        # session, within the same concurrency limit as page requests
+        max_workers = getattr(self.client, 'max_concurrency', None) or self.MAX_WORKERS
+        workers = min(max_workers, len(requested))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                var_name: executor.submit(self.client.get_variable_values, subject, var_name, ids=var_ids)
+                for var_name, var_ids in requested.items()
+            }
+            
+            for var_name, future in futures.items():
                 try:
-                    # Fetch values for this variable
-                    values = self.client.get_variable_values(subject, var_name)
-                    
-                    if values:
-                        # Convert to DataFrame for easy lookup
-                        metadata[var_name] = pd.DataFrame(values)
-                        logger.debug(f"Cached metadata for {var_name}: {len(values)} entries")
-                        
+                    values_by_var[var_name] = future.result()
                 except Exception as e:
                     logger.warning(f"Could not fetch metadata for variable '{var_name}': {e}")
-                    continue
+                    complete = False
         
-        except Exception as e:
-            logger.warning(f"Could not fetch subject variables: {e}")
+        return values_by_var, complete
+    
+    def _cached_variable_values(self, subject: str, variable: str) -> Optional[Dict[str, List]]:
+        """
+        Get all cached values of a variable, without making any requests.
         
-        # Cache the metadata
-        self._metadata_cache[cache_key] = metadata
+        Args:
+            subject: Subject name
+            variable: Variable name
+            
+        Returns:
+            Dictionary mapping field names to lists of the variable's values,
+            or None if they are not cached or only cached for a subset of IDs
+        """
+        if variable in self._partial_variables.get(subject, {}):
+            return None
+        
+        return self._metadata_cache.get(subject, {}).get(variable)
+    
+    def _cache_path(self, subject: str) -> Path:
+        """
+        Get the file used to persist metadata for a subject.
+        
+        Args:
+            subject: Subject name
+            
+        Returns:
+            Path of the pickle file for the subject
+        """
+        return self.cache_dir / f"{self.client.version}_{self.client.language}_{subject}.pkl"
+    
+    def _load_cached_metadata(self, subject: str) -> Optional[Dict[str, Dict[str, List]]]:
+        """
+        Load persisted metadata for a subject if it exists and has not expired.
+        
+        Args:
+            subject: Subject name
+            
+        Returns:
+            Metadata dictionary, or None if there is no usable cache file
+        """
+        if self.cache_dir is None:
+            return None
+        
+        path = self._cache_path(subject)
         
+        try:
+            if time.time() - path.stat().st_mtime >= self.cache_ttl:
+                return None
+            
+            with open(path, 'rb') as f:
+                metadata = pickle.load(f)
+        
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read metadata cache file '{path}': {e}")
+            return None
+        
+        logger.debug(f"Loaded metadata for subject '{subject}' from {path}")
         return metadata
     
+    def _save_cached_metadata(self, subject: str, metadata: Dict[str, Dict[str, List]]) -> None:
+        """
+        Persist metadata for a subject to the cache directory.
+        
+        The file is written to a temporary name and then moved into place, so
+        concurrent readers never see a partially written file.
+        
+        Args:
+            subject: Subject name
+            metadata: Metadata dictionary to persist
+        """
+        if self.cache_dir is None:
+            return
+        
+        path = self._cache_path(subject)
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        
+        except Exception as e:
+            logger.warning(f"Could not write metadata cache file '{path}': {e}")
+    
     def _enrich_dataframe(
     self,
     df: pd.DataFrame,
-    metadata: Dict[str, pd.DataFrame]
+    metadata: Dict[str, Dict[str, List]]
     ) -> pd.DataFrame:
         """
         Enrich a dataframe by adding label columns for ID columns.
         
         This method automatically detects ID columns and maps them to their
         corresponding metadata, making it robust to future API changes.
+        The label columns are added in place, since callers pass a dataframe
+        they have just built, which saves copying the whole frame.
         
         Args:
-            df: Original dataframe with ID columns
-            metadata: Dictionary of metadata DataFrames
+            df: Dataframe with ID columns (modified in place)
+            metadata: Dictionary mapping variable names to their values as columns
             
         Returns:
-            Enriched DataFrame with label columns
+            The same DataFrame with label columns added
         """
-        df_enriched = df.copy()
+        label_columns = self._label_columns(df)
+        if not label_columns:
+            return df
+        
+        for col_name, meta_key in label_columns.items():
+            # Try to find matching metadata
+            if meta_key in metadata:
+                self._add_label_column(df, col_name, metadata[meta_key], meta_key)
+            else:
+                logger.debug(f"No metadata found for column '{col_name}' (looking for '{meta_key}')")
         
+        return df
+
+    @staticmethod
+    def _label_columns(df: pd.DataFrame) -> Dict[str, str]:
+        """
+        Find the ID columns of a dataframe that can be given labels.
+        
+        Args:
+            df: Dataframe with ID columns
+            
+        Returns:
+            Dictionary mapping column names to their metadata keys
+        """
         # Columns that should NOT be mapped (data values, not IDs)
         EXCLUDED_COLUMNS = {'varde', 'sida', 'per_sida', 'sidor'}
         
@@ -156,38 +545,30 @@ class DataFetcher:
         }
         
         # Process special cases first
-        for col_name, meta_key in special_cases.items():
-            if col_name in df_enriched.columns and meta_key in metadata:
-                self._add_label_column(df_enriched, col_name, metadata[meta_key], meta_key)
+        label_columns = {
+            col_name: meta_key
+            for col_name, meta_key in special_cases.items()
+            if col_name in df.columns
+        }
         
         # Process all columns that end with 'Id'
-        for col_name in df_enriched.columns:
-            # Skip excluded columns
-            if col_name in EXCLUDED_COLUMNS:
-                continue
-                
-            # Skip if already processed in special cases
-            if col_name in special_cases:
+        for col_name in df.columns:
+            # Skip excluded columns and columns already processed in special cases
+            if col_name in EXCLUDED_COLUMNS or col_name in special_cases:
                 continue
             
             # Check if column ends with 'Id' (case-sensitive)
             if col_name.endswith('Id'):
                 # Derive metadata key by removing 'Id' suffix and lowercasing
-                meta_key = col_name[:-2].lower()
-                
-                # Try to find matching metadata
-                if meta_key in metadata:
-                    self._add_label_column(df_enriched, col_name, metadata[meta_key], meta_key)
-                else:
-                    logger.debug(f"No metadata found for column '{col_name}' (looking for '{meta_key}')")
+                label_columns[col_name] = col_name[:-2].lower()
         
-        return df_enriched
-
+        return label_columns
+    
     def _add_label_column(
         self,
         df: pd.DataFrame,
         id_col: str,
-        meta_df: pd.DataFrame,
+        meta_df: Union[Dict[str, List], pd.DataFrame],
         meta_key: str
     ) -> None:
         """
@@ -196,22 +577,29 @@ class DataFetcher:
         Args:
             df: DataFrame to add column to (modified in place)
             id_col: Name of the ID column
-            meta_df: Metadata DataFrame containing id-to-text mapping
+            meta_df: Metadata columns (dict of lists or DataFrame) with 'id' and 'text'
             meta_key: Metadata key name (for logging)
         """
         # Determine the correct ID and text field names in metadata
         id_field = 'id'
         text_field = 'text'
         
-        if id_field not in meta_df.columns or text_field not in meta_df.columns:
+        if id_field not in meta_df or text_field not in meta_df:
             logger.warning(
                 f"Metadata for '{meta_key}' missing required columns. "
-                f"Has: {meta_df.columns.tolist()}, needs: ['id', 'text']"
+                f"Has: {list(meta_df.keys())}, needs: ['id', 'text']"
             )
             return
         
-        # Create a mapping dictionary
-        id_to_text = dict(zip(meta_df[id_field], meta_df[text_field]))
+        # Index the metadata IDs; on duplicates the last entry wins, as with a dict
+        ids = pd.Index(meta_df[id_field])
+        keep = ~ids.duplicated(keep='last')
+        ids = ids[keep]
+        
+        # Store each distinct label once and refer to it by integer code
+        text_codes, categories = pd.factorize(
+            np.asarray(meta_df[text_field], dtype=object)[keep]
+        )
         
         # Determine label column name
         if id_col == 'ar':
@@ -219,19 +607,53 @@ class DataFetcher:
         else:
             label_col = id_col.replace('Id', '_label')
         
-        # Add the label column
-        df[label_col] = df[id_col].map(id_to_text)
+        values = df[id_col].to_numpy()
+        
+        if (
+            ids.dtype.kind in 'iu' and values.dtype.kind in 'iu' and len(ids) > 0
+            and ids.max() - ids.min() < self.DENSE_ID_SPAN
+        ):
+            # Dense integer IDs (kon, alder, ar, ...): gather codes straight from a
+            # lookup table indexed by ID, with -1 marking IDs without a label.
+            # The table has a -1 slot at each end that out-of-range IDs are
+            # clipped to, which avoids masking the rows.
+            low, high = ids.min(), ids.max()
+            lookup = np.full(high - low + 3, -1, dtype=np.intp)
+            lookup[ids.to_numpy() - low + 1] = text_codes
+            
+            positions = np.clip(values.astype(np.intp) - (low - 1), 0, len(lookup) - 1)
+            codes = lookup[positions]
+        else:
+            # Vectorized hash lookup of each row's ID; get_indexer returns -1 for
+            # unmapped IDs, which the appended sentinel turns into a missing label
+            positions = ids.get_indexer(values)
+            codes = np.append(text_codes, -1)[positions]
+        
+        df[label_col] = pd.Categorical.from_codes(codes, categories=categories)
         
-        # Log unmapped values (helpful for debugging)
-        unmapped = df[id_col][df[label_col].isna()].unique()
-        if len(unmapped) > 0 and len(unmapped) <= 5:  # Only log if few unmapped values
-            logger.debug(f"Column '{id_col}': {len(unmapped)} unmapped values: {unmapped.tolist()}")
+        # Log unmapped values (helpful for debugging); skip the scan otherwise
+        if logger.isEnabledFor(logging.DEBUG):
+            unmapped = pd.unique(values[codes == -1])
+            if len(unmapped) > 0 and len(unmapped) <= 5:  # Only log if few unmapped values
+                logger.debug(f"Column '{id_col}': {len(unmapped)} unmapped values: {unmapped.tolist()}")
         
         logger.debug(f"Added label column: {label_col} (from {meta_key})")
     
     def clear_cache(self):
-        """Clear the metadata cache."""
+        """Clear the metadata cache, including any persisted cache files."""
         self._metadata_cache.clear()
+        self._partial_variables.clear()
+        self.client.clear_metadata_cache()
+        
+        if self.cache_dir is not None and self.cache_dir.is_dir():
+            # Only remove the files this client version and language wrote
+            pattern = self._cache_path('*').name
+            for path in self.cache_dir.glob(pattern):
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"Could not remove metadata cache file '{path}': {e}")
+        
         logger.info("Metadata cache cleared")
     
     def get_cache_info(self) -> Dict[str, int]:
@@ -2,19 +2,30 @@
 Utility functions for socstatspy package
 """
 
-from typing import List, Union, Optional
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Union, Optional
 import re
+import numpy as np
+import pandas as pd
 
+# Patterns compiled once at import time
+_YEAR_RANGE_RE = re.compile(r'^\s*(\d{4})\s*-\s*(\d{4})\s*$')
+_SUBJECT_RE = re.compile(r'[a-z][a-z0-9_]*')
 
-def format_id_list(ids: Union[int, str, List[Union[int, str]], range]) -> str:
+
+def format_id_list(
+    ids: Union[int, str, List[Union[int, str]], range, np.ndarray, pd.Index, pd.Series]
+) -> str:
     """
     Format a list of IDs into a comma-separated string.
     
-    Accepts single values, lists, ranges, or already-formatted strings.
-    This allows flexible input formats while ensuring consistent API calls.
+    Accepts single values, lists, ranges, numpy arrays, pandas Index/Series,
+    or already-formatted strings. This allows flexible input formats while
+    ensuring consistent API calls.
     
     Args:
-        ids: Single ID, comma-separated string, list of IDs, or range object
+        ids: Single ID, comma-separated string, list of IDs, range object,
+             or array of IDs
         
     Returns:
         Comma-separated string of IDs
@@ -31,14 +42,19 @@ def format_id_list(ids: Union[int, str, List[Union[int, str]], range]) -> str:
         >>> format_id_list(['B15', 'I21'])
         'B15,I21'
     """
-    if isinstance(ids, (int, str)):
+    if isinstance(ids, (int, str, np.integer)):
         return str(ids)
     elif isinstance(ids, (list, tuple, range)):
-        return ','.join(str(i) for i in ids)
+        # map(str, ...) converts in C, without a generator frame per element
+        return ','.join(map(str, ids))
+    elif isinstance(ids, (np.ndarray, pd.Index, pd.Series)):
+        # tolist() yields Python scalars, which map(str, ...) formats faster
+        # than numpy's own string conversion (astype(str)) does
+        return ','.join(map(str, np.asarray(ids).tolist()))
     else:
         raise ValueError(
             f"Invalid type for IDs: {type(ids)}. "
-            f"Expected int, str, list, tuple, or range"
+            f"Expected int, str, list, tuple, range, or array"
         )
 
 
@@ -47,7 +63,8 @@ def parse_year_range(year_range: str) -> List[int]:
     Parse a year range string into a list of years.
     
     Args:
-        year_range: Year range (e.g., '2020-2023' or '2020,2021,2022')
+        year_range: Year range (e.g., '2020-2023' or '2020,2021,2022'),
+                    optionally with whitespace around the years
         
     Returns:
         List of years
@@ -58,15 +75,14 @@ def parse_year_range(year_range: str) -> List[int]:
         >>> parse_year_range('2020,2022')
         [2020, 2022]
     """
-    if '-' in year_range and ',' not in year_range:
-        # Range format: 2020-2023
-        match = re.match(r'(\d{4})-(\d{4})', year_range)
-        if match:
-            start, end = map(int, match.groups())
-            return list(range(start, end + 1))
+    # Range format: 2020-2023
+    match = _YEAR_RANGE_RE.match(year_range)
+    if match:
+        start, end = map(int, match.groups())
+        return list(range(start, end + 1))
     
-    # Comma-separated format
-    return [int(y.strip()) for y in year_range.split(',')]
+    # Comma-separated format; int() ignores surrounding whitespace
+    return list(map(int, year_range.split(',')))
 
 
 def validate_subject_name(subject: str) -> bool:
@@ -80,7 +96,36 @@ def validate_subject_name(subject: str) -> bool:
         True if valid, False otherwise
     """
     # Subject names should be lowercase alphanumeric with underscores
-    return bool(re.match(r'^[a-z][a-z0-9_]*$', subject))
+    return _SUBJECT_RE.fullmatch(subject) is not None
+
+
+def chunk_list_iter(items: Iterable, chunk_size: int) -> Iterator[List]:
+    """
+    Lazily split an iterable into chunks of specified size.
+    
+    Chunks are built as they are consumed, so this works on generators and
+    only one chunk is held in memory at a time. For lists already in memory,
+    chunk_list is faster.
+    
+    Args:
+        items: Iterable to chunk
+        chunk_size: Size of each chunk
+        
+    Yields:
+        Lists of up to chunk_size items
+        
+    Example:
+        >>> for chunk in chunk_list_iter(range(5), 2):
+        ...     print(chunk)
+        [0, 1]
+        [2, 3]
+        [4]
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
 
 
 def chunk_list(lst: List, chunk_size: int) -> List[List]:
@@ -101,6 +146,33 @@ def chunk_list(lst: List, chunk_size: int) -> List[List]:
     return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
 
+def record_fields(records: List[Dict]) -> List[str]:
+    """
+    Get the field names of a list of records, in order of appearance.
+    
+    Records returned by one endpoint normally share a schema, so the fields
+    are taken from the first record. Only if a set union of all keys finds
+    fields the first record lacks are they collected record by record.
+    
+    Args:
+        records: List of record dictionaries
+        
+    Returns:
+        List of field names
+        
+    Example:
+        >>> record_fields([{'id': 1}, {'id': 2, 'text': 'Man'}])
+        ['id', 'text']
+    """
+    if not records:
+        return []
+    
+    fields = list(records[0])
+    if len(set().union(*records)) > len(fields):
+        fields = list(dict.fromkeys(key for record in records for key in record))
+    return fields
+
+
 def build_filter_dict(**kwargs) -> dict:
     """
     Build a filter dictionary from keyword arguments, excluding None values.
@@ -3,10 +3,23 @@ Shared test fixtures
 """
 
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 from socstatspy.client import SocstatsClient
 
 
+@pytest.fixture
+def client():
+    """Client with default settings and empty caches"""
+    return SocstatsClient()
+
+
+@pytest.fixture
+def mock_request():
+    """Patched HTTP layer; set return_value or side_effect per test"""
+    with patch('requests.Session.request') as mock:
+        yield mock
+
+
 @pytest.fixture
 def mock_client():
     """Mocked client for testing"""
@@ -21,4 +34,4 @@ def sample_response():
         'sida': 1,
         'per_sida': 1,
         'sidor': 1
-    }
\ No newline at end of file
+    }
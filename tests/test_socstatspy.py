@@ -2,9 +2,19 @@
 Simple test suite for socstatspy
 """
 
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 import pytest
-from unittest.mock import Mock, patch
+import requests
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+from urllib3.exceptions import ConnectTimeoutError
+import numpy as np
 import pandas as pd
+import socstatspy
 from socstatspy.client import SocstatsClient
 from socstatspy.data_fetcher import DataFetcher
 from socstatspy.exceptions import (
@@ -17,10 +27,24 @@ from socstatspy.utils import (
     format_id_list, 
     validate_subject_name, 
     parse_year_range,
-    chunk_list
+    chunk_list,
+    chunk_list_iter,
+    record_fields
 )
 
 
+def _mock_response(payload=None, status_code=200, content=None):
+    """Lightweight stand-in for an HTTP response carrying a JSON payload"""
+    if content is None:
+        content = json.dumps(payload).encode('utf-8')
+    return SimpleNamespace(
+        status_code=status_code,
+        content=content,
+        text=content.decode('utf-8'),
+        raise_for_status=lambda: None
+    )
+
+
 class TestClient:
     """Test SocstatsClient"""
     
@@ -37,107 +61,160 @@ class TestClient:
         assert client.language == 'en'
         assert client.timeout == 60
     
-    def test_build_url(self):
-        client = SocstatsClient()
+    def test_build_url(self, client):
         url = client._build_url('v1', 'sv', 'dodsorsaker')
         assert 'v1/sv/dodsorsaker' in url
     
-    @patch('requests.Session.request')
-    def test_list_subjects(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: [
-                {'namn': 'dodsorsaker', 'text': 'Dödsorsaker'},
-                {'namn': 'amning', 'text': 'Amning'}
-            ]
-        )
+    def test_session_headers(self, client):
+        assert client.session.headers['User-Agent'] == f'socstatspy/{socstatspy.__version__}'
+        assert client.session.headers['Accept'] == 'application/json'
+        assert 'gzip' in client.session.headers['Accept-Encoding']
+    
+    def test_session_adapter(self, client):
+        adapter = client.session.get_adapter('https://sdb.socialstyrelsen.se')
+        assert client.max_concurrency == 8
+        assert adapter._pool_maxsize == 32
+        assert 429 in adapter.max_retries.status_forcelist
+        assert adapter.max_retries.total == client.max_retries
+        
+        client = SocstatsClient(max_concurrency=64)
+        assert client.session.get_adapter('https://sdb.socialstyrelsen.se')._pool_maxsize == 64
+    
+    def test_connections_reused(self, monkeypatch):
+        client_ports = []
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep connections alive
+            
+            def do_GET(self):
+                client_ports.append(self.client_address[1])
+                body = b'[{"namn": "kon", "text": "K\\u00f6n"}]'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        monkeypatch.setattr(SocstatsClient, 'BASE_URL', f'http://127.0.0.1:{server.server_port}/api')
         
         client = SocstatsClient()
+        try:
+            client.list_subjects()
+            client.get_subject_variables('dodsorsaker')
+            client.get_subject_variables('amning')
+        finally:
+            client.session.close()
+            server.shutdown()
+            server.server_close()
+        
+        # All requests went over one pooled keep-alive connection
+        assert len(client_ports) == 3
+        assert len(set(client_ports)) == 1
+    
+    def test_list_subjects(self, client, mock_request):
+        mock_request.return_value = _mock_response([
+            {'namn': 'dodsorsaker', 'text': 'Dödsorsaker'},
+            {'namn': 'amning', 'text': 'Amning'}
+        ])
+        
         subjects = client.list_subjects()
         
         assert len(subjects) == 2
         assert subjects[0]['namn'] == 'dodsorsaker'
     
-    @patch('requests.Session.request')
-    def test_list_subjects_as_dataframe(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: [{'namn': 'dodsorsaker', 'text': 'Dödsorsaker'}]
-        )
+    def test_list_subjects_as_dataframe(self, client, mock_request):
+        mock_request.return_value = _mock_response([{'namn': 'dodsorsaker', 'text': 'Dödsorsaker'}])
         
-        client = SocstatsClient()
         df = client.list_subjects(as_dataframe=True)
         
         assert isinstance(df, pd.DataFrame)
-        assert 'namn' in df.columns
-    
-    @patch('requests.Session.request')
-    def test_get_subject_variables(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: [
-                {'namn': 'kon', 'text': 'Kön'},
-                {'namn': 'region', 'text': 'Region'}
-            ]
-        )
+        assert df.columns.tolist() == ['namn', 'text']
+        assert df.loc[0, 'text'] == 'Dödsorsaker'
+
+    def test_list_subjects_as_dataframe_optional_fields(self, client, mock_request):
+        mock_request.return_value = _mock_response([
+            {'namn': 'dodsorsaker', 'text': 'Dödsorsaker'},
+            {'namn': 'amning', 'text': 'Amning', 'info': 'Statistik om amning'}
+        ])
+
+        df = client.list_subjects(as_dataframe=True)
+
+        assert df.columns.tolist() == ['namn', 'text', 'info']
+        assert pd.isna(df.loc[0, 'info'])
+        assert df.loc[1, 'info'] == 'Statistik om amning'
+
+    def test_get_subject_variables(self, client, mock_request):
+        mock_request.return_value = _mock_response([
+            {'namn': 'kon', 'text': 'Kön'},
+            {'namn': 'region', 'text': 'Region'}
+        ])
         
-        client = SocstatsClient()
         variables = client.get_subject_variables('dodsorsaker')
         
         assert len(variables) == 2
         assert variables[0]['namn'] == 'kon'
     
-    @patch('requests.Session.request')
-    def test_get_variable_values(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: [
-                {'id': 1, 'text': 'Man'},
-                {'id': 2, 'text': 'Kvinna'}
-            ]
-        )
+    def test_metadata_responses_cached(self, client, mock_request):
+        mock_request.return_value = _mock_response([{'namn': 'kon', 'text': 'Kön'}])
+        
+        variables = client.get_subject_variables('dodsorsaker')
+        variables.append({'namn': 'region', 'text': 'Region'})
+        variables[0]['text'] = 'Ändrad'
+        
+        # Served from memory, unaffected by changes to the earlier result
+        assert client.get_subject_variables('dodsorsaker') == [{'namn': 'kon', 'text': 'Kön'}]
+        assert mock_request.call_count == 1
+        
+        client.get_subject_variables('amning')
+        assert mock_request.call_count == 2
+        
+        client.clear_metadata_cache()
+        client.get_subject_variables('dodsorsaker')
+        assert mock_request.call_count == 3
+    
+    def test_get_variable_values(self, client, mock_request):
+        mock_request.return_value = _mock_response([
+            {'id': 1, 'text': 'Man'},
+            {'id': 2, 'text': 'Kvinna'}
+        ])
         
-        client = SocstatsClient()
         values = client.get_variable_values('dodsorsaker', 'kon')
         
         assert len(values) == 2
         assert values[0]['id'] == 1
     
-    @patch('requests.Session.request')
-    def test_get_data_basic(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: {
-                'data': [{'konId': 1, 'varde': 100}],
-                'sida': 1
-            }
-        )
+    def test_get_data_basic(self, client, mock_request):
+        mock_request.return_value = _mock_response({
+            'data': [{'konId': 1, 'varde': 100}],
+            'sida': 1
+        })
         
-        client = SocstatsClient()
         result = client.get_data('dodsorsaker', matt=1)
         
         assert 'data' in result
         assert len(result['data']) == 1
     
-    @patch('requests.Session.request')
-    def test_get_data_with_filters(self, mock_request):
-        mock_request.return_value = Mock(
-            status_code=200,
-            json=lambda: {
-                'data': [{'konId': 1, 'ar': 2020, 'varde': 100}],
-                'sida': 1
-            }
-        )
+    def test_get_data_with_filters(self, client, mock_request):
+        mock_request.return_value = _mock_response({
+            'data': [{'konId': 1, 'ar': 2020, 'varde': 100}],
+            'sida': 1
+        })
         
-        client = SocstatsClient()
         result = client.get_data('dodsorsaker', matt=1, ar='2020', kon=1)
         
         assert len(result['data']) == 1
         assert result['data'][0]['ar'] == 2020
+        assert mock_request.call_args[1]['url'] == (
+            'https://sdb.socialstyrelsen.se/api/v1/sv/dodsorsaker/resultat/matt/1/ar/2020/kon/1'
+        )
     
-    @patch('requests.Session.request')
-    @patch('time.sleep')
-    def test_pagination(self, mock_sleep, mock_request):
+    def test_pagination(self, client, mock_request):
         # First page with next link
         page1 = {
             'data': [{'varde': 100}],
@@ -149,36 +226,157 @@ class TestClient:
         }
         
         mock_request.side_effect = [
-            Mock(status_code=200, json=lambda: page1),
-            Mock(status_code=200, json=lambda: page2)
+            _mock_response(page1),
+            _mock_response(page2)
         ]
         
-        client = SocstatsClient()
         result = client.get_data('dodsorsaker', matt=1, auto_paginate=True)
         
         assert len(result['data']) == 2
     
-    @patch('requests.Session.request')
-    def test_404_error(self, mock_request):
-        mock_request.return_value = Mock(status_code=404)
+    def test_pagination_stops_on_partial_page(self, client, mock_request):
+        mock_request.side_effect = [
+            _mock_response({
+                'data': [{'varde': 100}, {'varde': 150}],
+                'per_sida': 2,
+                'nasta_sida': 'https://example.com?sida=2'
+            }),
+            _mock_response({
+                'data': [{'varde': 200}],
+                'per_sida': 2,
+                'nasta_sida': 'https://example.com?sida=3'
+            })
+        ]
+        
+        result = client.get_data('dodsorsaker', matt=1, per_sida=2)
+        
+        assert len(result['data']) == 3
+        assert result['nasta_sida'] is None
+        assert mock_request.call_count == 2
+    
+    def test_pagination_concurrent(self, mock_request):
+        # First page reports the total page count
+        page1 = {
+            'data': [{'varde': 100}],
+            'sidor': 3,
+            'nasta_sida': 'https://example.com/resultat?sida=2&per_sida=1'
+        }
+        
+        def respond(method, url, **kwargs):
+            query = parse_qs(urlsplit(url).query)
+            if 'sida' not in query:
+                return _mock_response(page1)
+            page = int(query['sida'][0])
+            # Earlier pages answer later, so pages complete out of order
+            time.sleep(0.05 * (3 - page))
+            return _mock_response({'data': [{'varde': page * 100}]})
+        
+        mock_request.side_effect = respond
+        
+        client = SocstatsClient(max_concurrency=2)
+        result = client.get_data('dodsorsaker', matt=1)
+        
+        assert [row['varde'] for row in result['data']] == [100, 200, 300]
+        assert result['sidor'] == 3
+        assert result['nasta_sida'] is None
+        assert mock_request.call_count == 3
+
+        # With a page limit, the next page link points past the pages fetched
+        result = client.get_data('dodsorsaker', matt=1, max_pages=2)
+
+        assert [row['varde'] for row in result['data']] == [100, 200]
+        assert parse_qs(urlsplit(result['nasta_sida']).query)['sida'] == ['3']
+
+    def test_get_data_iter(self, client, mock_request):
+        mock_request.side_effect = [
+            _mock_response({
+                'data': [{'varde': 100}, {'varde': 150}],
+                'per_sida': 2,
+                'nasta_sida': 'https://example.com?sida=2'
+            }),
+            _mock_response({
+                'data': [{'varde': 200}],
+                'per_sida': 2,
+                'nasta_sida': 'https://example.com?sida=3'
+            })
+        ]
+        
+        rows = client.get_data_iter('dodsorsaker', matt=1, per_sida=2)
+        
+        # Pages are only requested as the iterator is consumed
+        assert next(rows) == {'varde': 100}
+        assert mock_request.call_count == 1
+        assert [row['varde'] for row in rows] == [150, 200]
+        assert mock_request.call_count == 2
+    
+    def test_404_error(self, client, mock_request):
+        mock_request.return_value = _mock_response(status_code=404)
         
-        client = SocstatsClient()
         
         with pytest.raises(SocstatsNotFoundError):
             client.list_subjects()
     
-    @patch('requests.Session.request')
-    def test_rate_limit_error(self, mock_request):
-        mock_request.return_value = Mock(status_code=429)
+    def test_rate_limit_error(self, client, mock_request):
+        mock_request.return_value = _mock_response(status_code=429)
         
-        client = SocstatsClient()
         
         with pytest.raises(SocstatsRateLimitError):
             client.list_subjects()
     
-    def test_validation_error(self):
-        client = SocstatsClient()
+    def test_http_cache_adapter(self, tmp_path):
+        cachecontrol = pytest.importorskip('cachecontrol')
+        
+        client = SocstatsClient(cache_dir=tmp_path)
+        adapter = client.session.get_adapter('https://sdb.socialstyrelsen.se')
+        
+        assert isinstance(adapter, cachecontrol.CacheControlAdapter)
+        assert adapter._pool_maxsize == SocstatsClient.POOL_MAXSIZE
+    
+    def test_retry_backoff(self, client):
+        retry = client.session.get_adapter('https://sdb.socialstyrelsen.se').max_retries
+        assert retry.connect == retry.read == client.max_retries
+        
+        for _ in range(3):
+            retry = retry.increment('GET', '/api', error=ConnectTimeoutError())
+        
+        # Third consecutive error: 0.3 * 2**2 seconds with +-50% jitter
+        assert 0.6 <= retry.get_backoff_time() <= 1.8
+    
+    def test_timeout_error(self, client, mock_request):
+        mock_request.side_effect = requests.exceptions.Timeout()
+        
+        
+        with pytest.raises(SocstatsAPIError):
+            client.list_subjects()
+        assert mock_request.call_count == 1
+    
+    def test_invalid_json_error(self, client, mock_request):
+        mock_request.return_value = _mock_response(content=b'<html>')
+        
+        
+        with pytest.raises(SocstatsAPIError):
+            client.list_subjects()
+    
+    def test_unexpected_data_response(self, client, mock_request):
+        mock_request.return_value = _mock_response({'data': {'varde': 100}})
         
+        with pytest.raises(SocstatsAPIError, match="'data' list"):
+            client.get_data('dodsorsaker', matt=1)
+    
+    def test_text_filter_uses_cached_metadata(self, client, mock_request):
+        client.data_fetcher._metadata_cache['dodsorsaker'] = {
+            'region': {
+                'id': [1, 10, 25],
+                'text': ['Stockholms län', 'Blekinge län', 'Norrbottens län']
+            }
+        }
+        
+        values = client.get_variable_values('dodsorsaker', 'region', text_filter='BOTTEN')
+        
+        assert values == [{'id': 25, 'text': 'Norrbottens län'}]
+        mock_request.assert_not_called()
+    
+    def test_validation_error(self, client):
         with pytest.raises(SocstatsValidationError):
             client.get_variable_values('dodsorsaker', 'region', ids=[1], text_filter='test')
 
@@ -187,7 +385,7 @@ class TestDataFetcher:
     """Test DataFetcher"""
     
     @patch('socstatspy.client.SocstatsClient.get_data')
-    def test_get_data_as_dataframe(self, mock_get_data):
+    def test_get_data_as_dataframe(self, mock_get_data, client):
         mock_get_data.return_value = {
             'data': [
                 {'konId': 1, 'varde': 100},
@@ -197,29 +395,43 @@ class TestDataFetcher:
             'amne': 'dodsorsaker'
         }
         
-        client = SocstatsClient()
         df = client.get_data_as_dataframe('dodsorsaker', matt=1)
         
         assert isinstance(df, pd.DataFrame)
         assert len(df) == 2
         assert 'varde' in df.columns
+        assert df['konId'].dtype == 'int32'
         assert df.attrs['subject'] == 'dodsorsaker'
-    
+
+    @patch('socstatspy.client.SocstatsClient.get_data')
+    def test_get_data_as_dataframe_optional_fields(self, mock_get_data, client):
+        mock_get_data.return_value = {
+            'data': [
+                {'konId': 1, 'varde': 100},
+                {'konId': 2, 'varde': 150, 'regionId': 3}
+            ],
+            'sida': 1
+        }
+
+        df = client.get_data_as_dataframe('dodsorsaker', matt=1)
+
+        assert df.columns.tolist() == ['konId', 'varde', 'regionId']
+        assert pd.isna(df.loc[0, 'regionId'])
+        assert df.loc[1, 'regionId'] == 3
+
     @patch('socstatspy.client.SocstatsClient.get_data')
-    def test_empty_data(self, mock_get_data):
+    def test_empty_data(self, mock_get_data, client):
         mock_get_data.return_value = {
             'data': [],
             'sida': 1
         }
         
-        client = SocstatsClient()
         df = client.get_data_as_dataframe('dodsorsaker', matt=1)
         
         assert isinstance(df, pd.DataFrame)
         assert len(df) == 0
     
-    def test_metadata_caching(self):
-        mock_client = Mock(spec=SocstatsClient)
+    def test_metadata_caching(self, mock_client):
         mock_client.get_subject_variables.return_value = [
             {'namn': 'kon', 'text': 'Kön'}
         ]
@@ -237,13 +449,270 @@ class TestDataFetcher:
         assert metadata1 == metadata2
         assert mock_client.get_subject_variables.call_count == 1
     
-    def test_enrich_dataframe(self):
-        mock_client = Mock(spec=SocstatsClient)
+    def test_metadata_fetched_concurrently(self, mock_client):
+        mock_client.get_subject_variables.return_value = [
+            {'namn': name, 'text': name} for name in ('kon', 'region', 'ar')
+        ]
+        
+        # Every request waits until all three are in flight at the same time
+        barrier = threading.Barrier(3, timeout=5)
+        
+        def values(subject, variable, ids=None):
+            barrier.wait()
+            return [{'id': 1, 'text': variable}]
+        
+        mock_client.get_variable_values.side_effect = values
+        
+        fetcher = DataFetcher(mock_client)
+        metadata = fetcher._get_subject_metadata('dodsorsaker')
+        
+        assert list(metadata) == ['kon', 'region', 'ar']
+        assert not barrier.broken
+    
+    def test_metadata_concurrency_limit(self, mock_client):
+        mock_client.max_concurrency = 2
+        mock_client.get_subject_variables.return_value = [
+            {'namn': name, 'text': name} for name in ('kon', 'region', 'ar', 'alder')
+        ]
+        
+        lock = threading.Lock()
+        active = []
+        peak = []
+        
+        def values(subject, variable, ids=None):
+            with lock:
+                active.append(variable)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(variable)
+            return [{'id': 1, 'text': variable}]
+        
+        mock_client.get_variable_values.side_effect = values
+        
+        DataFetcher(mock_client)._get_subject_metadata('dodsorsaker')
+        
+        assert max(peak) == 2
+    
+    def test_metadata_fetch_coalesced(self, mock_client):
+        
+        def variables(subject):
+            time.sleep(0.1)
+            return [{'namn': 'kon', 'text': 'Kön'}]
+        
+        mock_client.get_subject_variables.side_effect = variables
+        mock_client.get_variable_values.return_value = [{'id': 1, 'text': 'Man'}]
+        
+        fetcher = DataFetcher(mock_client)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(fetcher._get_subject_metadata('dodsorsaker'))
+            )
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # Only the first caller hits the API; the others wait for its result
+        assert mock_client.get_subject_variables.call_count == 1
+        assert mock_client.get_variable_values.call_count == 1
+        assert results == [{'kon': {'id': [1], 'text': ['Man']}}] * 3
+        assert fetcher._inflight == {}
+
+    def test_partial_metadata_top_up_serialized(self, mock_client):
+        mock_client.get_subject_variables.return_value = [
+            {'namn': 'diagnos', 'text': 'Diagnos'}
+        ]
+        labels = {'B15': 'Hepatit', 'I21': 'Hjärtinfarkt', 'X99': 'Övrigt'}
+
+        def values(subject, variable, ids=None):
+            time.sleep(0.05)
+            return [{'id': i, 'text': labels[i]} for i in (ids or labels)]
+
+        mock_client.get_variable_values.side_effect = values
+
+        fetcher = DataFetcher(mock_client)
+        fetcher._get_subject_metadata('dodsorsaker', ids={'diagnos': ['B15']})
+
+        # One caller tops up an ID while two others ask for every value
+        errors = []
+
+        def fetch(ids):
+            try:
+                fetcher._get_subject_metadata('dodsorsaker', ids=ids)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch, args=({'diagnos': ['B15', 'I21']},))]
+        threads += [threading.Thread(target=fetch, args=(None,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert sorted(fetcher._metadata_cache['dodsorsaker']['diagnos']['id']) == ['B15', 'I21', 'X99']
+        # The variable is completed in full only once
+        assert mock_client.get_variable_values.call_count == 3
+        assert fetcher._inflight == {}
+
+    def test_metadata_disk_cache(self, mock_client, tmp_path):
+        mock_client.version = 'v1'
+        mock_client.language = 'sv'
+        mock_client.get_subject_variables.return_value = [
+            {'namn': 'kon', 'text': 'Kön'}
+        ]
+        mock_client.get_variable_values.return_value = [
+            {'id': 1, 'text': 'Man'}
+        ]
+        
+        # First fetcher fetches over HTTP and persists the metadata
+        DataFetcher(mock_client, cache_dir=tmp_path)._get_subject_metadata('dodsorsaker')
+        assert (tmp_path / 'v1_sv_dodsorsaker.pkl').exists()
+        
+        # A new fetcher (e.g. a new process) reads it back without HTTP calls
+        fetcher = DataFetcher(mock_client, cache_dir=tmp_path)
+        metadata = fetcher._get_subject_metadata('dodsorsaker')
+        
+        assert metadata['kon'] == {'id': [1], 'text': ['Man']}
+        assert mock_client.get_subject_variables.call_count == 1
+        
+        # Unrelated pickles in the same directory are left alone
+        (tmp_path / 'model.pkl').write_bytes(b'')
+        fetcher.clear_cache()
+        assert [path.name for path in tmp_path.glob('*.pkl')] == ['model.pkl']
+
+    def test_enriched_dataframe_disk_cache(self, mock_request, tmp_path):
+
+        def respond(method, url, **kwargs):
+            path = urlsplit(url).path
+            if '/resultat/' in path:
+                return _mock_response({'data': [{'konId': 1, 'ar': 2020, 'varde': 100}]})
+            if path.endswith('/dodsorsaker'):
+                return _mock_response([{'namn': 'kon', 'text': 'Kön'}, {'namn': 'ar', 'text': 'År'}])
+            if path.endswith('/kon'):
+                return _mock_response([{'id': 1, 'text': 'Man'}, {'id': 2, 'text': 'Kvinna'}])
+            return _mock_response([{'id': 2020, 'text': '2020'}])
+
+        mock_request.side_effect = respond
+
+        df = SocstatsClient(cache_dir=tmp_path).get_data_as_dataframe(
+            'dodsorsaker', matt=1, include_metadata=True
+        )
+        assert df.loc[0, 'kon_label'] == 'Man'
+        assert (tmp_path / 'v1_sv_dodsorsaker.pkl').exists()
+
+        # A new client labels the data without any metadata requests
+        mock_request.reset_mock()
+        df = SocstatsClient(cache_dir=tmp_path).get_data_as_dataframe(
+            'dodsorsaker', matt=1, include_metadata=True
+        )
+        assert df.loc[0, 'kon_label'] == 'Man'
+        assert mock_request.call_count == 1
+
+    def test_metadata_fetches_only_needed_ids(self, mock_client):
+        mock_client.get_subject_variables.return_value = [
+            {'namn': 'diagnos', 'text': 'Diagnos'}
+        ]
+        labels = {'B15': 'Hepatit', 'I21': 'Hjärtinfarkt', 'X99': 'Övrigt'}
+        mock_client.get_variable_values.side_effect = (
+            lambda subject, variable, ids=None: [
+                {'id': i, 'text': labels[i]} for i in (ids or labels)
+            ]
+        )
+        
+        fetcher = DataFetcher(mock_client)
+        
+        metadata = fetcher._get_subject_metadata('dodsorsaker', ids={'diagnos': ['B15']})
+        assert metadata['diagnos']['id'] == ['B15']
+        mock_client.get_variable_values.assert_called_with('dodsorsaker', 'diagnos', ids=['B15'])
+        
+        # Only the IDs not fetched before are requested
+        metadata = fetcher._get_subject_metadata('dodsorsaker', ids={'diagnos': ['B15', 'I21']})
+        assert metadata['diagnos']['id'] == ['B15', 'I21']
+        mock_client.get_variable_values.assert_called_with('dodsorsaker', 'diagnos', ids=['I21'])
+        
+        # Without ID hints the variable is completed in full
+        metadata = fetcher._get_subject_metadata('dodsorsaker')
+        assert sorted(metadata['diagnos']['id']) == ['B15', 'I21', 'X99']
+        assert mock_client.get_subject_variables.call_count == 1
+    
+    def test_metadata_ids_from_columns_with_missing_values(self, client, mock_request):
+        urls = []
+
+        def respond(method, url, **kwargs):
+            urls.append(url)
+            path = urlsplit(url).path
+            if '/resultat/' in path:
+                return _mock_response({'data': [
+                    {'konId': 1, 'regionId': 3, 'varde': 100},
+                    {'konId': None, 'regionId': 1, 'varde': 150},
+                    {'konId': 2, 'varde': 200}
+                ]})
+            if path.endswith('/dodsorsaker'):
+                return _mock_response([{'namn': 'kon', 'text': 'Kön'}, {'namn': 'region', 'text': 'Region'}])
+            if path.endswith('/kon/1,2'):
+                return _mock_response([{'id': 1, 'text': 'Man'}, {'id': 2, 'text': 'Kvinna'}])
+            if path.endswith('/region/3,1'):
+                return _mock_response([{'id': 1, 'text': 'Stockholm'}, {'id': 3, 'text': 'Uppsala'}])
+            return _mock_response(status_code=404, content=b'')
+
+        mock_request.side_effect = respond
+
+        df = client.get_data_as_dataframe('dodsorsaker', matt=1, include_metadata=True)
+
+        # Float columns holding integer IDs are requested as integers
+        assert df['kon_label'].tolist()[::2] == ['Man', 'Kvinna']
+        assert df['region_label'].tolist()[:2] == ['Uppsala', 'Stockholm']
+        assert not any('.0' in url for url in urls)
+
+    def test_metadata_failed_ids_fetched_again(self, mock_client):
+        mock_client.get_subject_variables.return_value = [
+            {'namn': 'kon', 'text': 'Kön'}
+        ]
+        mock_client.get_variable_values.side_effect = [
+            SocstatsAPIError("Request failed"),
+            [{'id': 1, 'text': 'Man'}]
+        ]
+
+        fetcher = DataFetcher(mock_client)
+
+        assert fetcher._get_subject_metadata('dodsorsaker', ids={'kon': [1]}) == {}
+
+        # IDs of a failed request are not recorded as fetched, so they are requested again
+        metadata = fetcher._get_subject_metadata('dodsorsaker', ids={'kon': [1]})
+        assert metadata['kon'] == {'id': [1], 'text': ['Man']}
+        assert mock_client.get_variable_values.call_count == 2
+
+    def test_metadata_variable_failure(self, mock_client):
+        mock_client.get_subject_variables.return_value = [
+            {'namn': 'kon', 'text': 'Kön'},
+            {'namn': 'region', 'text': 'Region'}
+        ]
+        
+        def values(subject, variable, ids=None):
+            if variable == 'region':
+                raise SocstatsAPIError("Request failed")
+            return [{'id': 1, 'text': 'Man'}]
+        
+        mock_client.get_variable_values.side_effect = values
+        
+        fetcher = DataFetcher(mock_client)
+        metadata = fetcher._get_subject_metadata('dodsorsaker')
+        
+        assert list(metadata) == ['kon']
+        assert mock_client.get_variable_values.call_count == 2
+    
+    def test_enrich_dataframe(self, mock_client):
         fetcher = DataFetcher(mock_client)
         
         df = pd.DataFrame({
-            'konId': [1, 2],
-            'varde': [100, 150]
+            'konId': [1, 2, 1],
+            'varde': [100, 150, 120]
         })
         
         metadata = {
@@ -252,9 +721,48 @@ class TestDataFetcher:
         
         enriched = fetcher._enrich_dataframe(df, metadata)
         
+        assert enriched is df
         assert 'kon_label' in enriched.columns
         assert enriched.loc[0, 'kon_label'] == 'Man'
         assert enriched.loc[1, 'kon_label'] == 'Kvinna'
+        # Labels are stored once as categories, rows refer to them by code
+        assert isinstance(enriched['kon_label'].dtype, pd.CategoricalDtype)
+        assert enriched['kon_label'].cat.categories.tolist() == ['Man', 'Kvinna']
+        assert enriched['kon_label'].cat.codes.tolist() == [0, 1, 0]
+    
+    def test_enrich_dataframe_dense_integer_ids(self, mock_client):
+        fetcher = DataFetcher(mock_client)
+        
+        df = pd.DataFrame({'ar': [2019, 2020, 2022, 2030, 1990]}, dtype='int32')
+        metadata = {'ar': {'id': [2020, 2021, 2019], 'text': ['2020', '2021', '2019']}}
+        
+        enriched = fetcher._enrich_dataframe(df, metadata)
+        
+        assert enriched['ar_label'].tolist()[:2] == ['2019', '2020']
+        assert enriched['ar_label'][2:].isna().all()
+    
+    def test_enrich_dataframe_unmapped_and_shared_labels(self, mock_client):
+        fetcher = DataFetcher(mock_client)
+        
+        df = pd.DataFrame({
+            'diagnosId': ['B15', 'I21', 'X99', 'B15'],
+            'varde': [1, 2, 3, 4]
+        })
+        
+        metadata = {
+            'diagnos': {
+                'id': ['I21', 'B15', 'B16'],
+                'text': ['Hjärtinfarkt', 'Hepatit', 'Hepatit']
+            }
+        }
+        
+        enriched = fetcher._enrich_dataframe(df, metadata)
+        labels = enriched['diagnos_label']
+        
+        assert isinstance(labels.dtype, pd.CategoricalDtype)
+        assert labels.tolist()[:2] == ['Hepatit', 'Hjärtinfarkt']
+        assert pd.isna(labels[2])
+        assert labels[3] == 'Hepatit'
 
 
 class TestUtils:
@@ -271,15 +779,23 @@ class TestUtils:
     def test_format_id_list_range(self):
         assert format_id_list(range(2018, 2021)) == '2018,2019,2020'
     
+    def test_format_id_list_array(self):
+        assert format_id_list(np.array([2018, 2019])) == '2018,2019'
+        assert format_id_list(pd.Index(['B15', 'I21'])) == 'B15,I21'
+        assert format_id_list(np.int64(7)) == '7'
+        assert format_id_list(pd.Series(range(5000))) == ','.join(map(str, range(5000)))
+    
     def test_format_id_list_invalid(self):
         with pytest.raises(ValueError):
             format_id_list({'invalid': 'type'})
     
     def test_parse_year_range_dash(self):
         assert parse_year_range('2020-2023') == [2020, 2021, 2022, 2023]
+        assert parse_year_range(' 2020 - 2022 ') == [2020, 2021, 2022]
     
     def test_parse_year_range_comma(self):
         assert parse_year_range('2020,2021,2023') == [2020, 2021, 2023]
+        assert parse_year_range('2020, 2023') == [2020, 2023]
     
     def test_validate_subject_name_valid(self):
         assert validate_subject_name('dodsorsaker') is True
@@ -291,11 +807,22 @@ class TestUtils:
         assert validate_subject_name('123test') is False
         assert validate_subject_name('test-name') is False
         assert validate_subject_name('') is False
+        assert validate_subject_name('dodsorsaker\n') is False
     
     def test_chunk_list(self):
         assert chunk_list([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
         assert chunk_list([1, 2, 3], 10) == [[1, 2, 3]]
         assert chunk_list([], 2) == []
+    
+    def test_chunk_list_iter(self):
+        chunks = chunk_list_iter(iter(range(5)), 2)
+        assert next(chunks) == [0, 1]
+        assert list(chunks) == [[2, 3], [4]]
+    
+    def test_record_fields(self):
+        assert record_fields([]) == []
+        assert record_fields([{'id': 1, 'text': 'Man'}, {'text': 'Kvinna', 'id': 2}]) == ['id', 'text']
+        assert record_fields([{'id': 1}, {'id': 2, 'text': 'Kvinna'}]) == ['id', 'text']
 
 
 class TestExceptions: